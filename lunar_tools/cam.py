@@ -23,20 +23,37 @@ import threading
 import time
 import glob
 import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from lunar_tools.utils import get_os_type
 
+OS_TYPE = get_os_type()
+
 
 class WebCam():
-    def __init__(self, cam_id=0, shape_hw=(576,1024)):
+    def __init__(self, cam_id=0, shape_hw=(576,1024), rgba=False):
         """
+        Args:
+            rgba: bool
+                If True, get_img returns HxWx4 images with alpha=255, which Renderer can consume
+                without adding an alpha channel.
         """
         self.do_mirror = False
         self.shift_colors = True
         self.cam_id = cam_id
         self.shape_hw = shape_hw
-        self.img_last = np.zeros((shape_hw[0], shape_hw[1], 3), dtype=np.uint8)
+        self.nmb_channels = 4 if rgba else 3
+        # triple buffering: get_img holds the front buffer, the thread writes into the back buffer
+        # and hands finished buffers over through a single slot, replacing a frame nobody picked up
+        self._bufs = [np.zeros((shape_hw[0], shape_hw[1], self.nmb_channels), dtype=np.uint8) for _ in range(3)]
+        for buf in self._bufs:
+            buf[:, :, 3:] = 255
+        self._slot = queue.Queue(maxsize=1)
+        self._front = 0
+        self._back = 1
+        self._last_handed = 0
         self.device_ptr = 0
-        self.sleep_time_thread = 0.001 
+        self.target_fps = None  # optional rate limit for the capture thread, grab() already blocks until a frame arrives
         self.smart_init()
         
         self.threader_active = True
@@ -45,56 +62,90 @@ class WebCam():
             
                 
     def init_ubuntu(self):
-        device_paths = glob.glob('/dev/video*')
+        device_paths = sorted(glob.glob('/dev/video*'), key=lambda p: int(p[len('/dev/video'):]))
         if len(device_paths) == 0:
             raise ValueError("No cameras found")
+        if hasattr(self, 'cam'):
+            self.cam.release()
+            
         if self.cam_id == -1:
-            device_ptr = device_paths[0]
+            # probe all devices in parallel, the lowest sorted device delivering a frame wins.
+            # we only wait for the probes up to the winner, later ones release their capture when done
+            def release_probe(future):
+                candidate = future.result()
+                if candidate is not None:
+                    candidate.release()
+                    
+            cam, device_ptr = None, None
+            executor = ThreadPoolExecutor(max_workers=len(device_paths))
+            futures = [executor.submit(self.open_device, path) for path in device_paths]
+            for path, future in zip(device_paths, futures):
+                if cam is None:
+                    cam = future.result()
+                    if cam is not None:
+                        device_ptr = path
+                        print(f"smart_init: using device_ptr {device_ptr}")
+                else:
+                    future.add_done_callback(release_probe)
+            executor.shutdown(wait=False)
         else:
             device_ptr = f'/dev/video{self.cam_id}'
-        self.cam = cv2.VideoCapture(device_ptr)
-        
-        while True:
-            self.release()
-            if self.cam_id == -1 and len(device_paths) > 1:
-                device_paths.remove(device_ptr)
-                device_ptr = device_paths[0]
-                print(f"smart_init: using device_ptr {device_ptr}")
+            cam = self.open_device(device_ptr)
             
-            self.cam = cv2.VideoCapture(device_ptr)
-            self.set_cap_props()
-            _, img = self.cam.read()
-            if img is not None:
-                break
-            print("release loop...")
-            time.sleep(0.2)
+        if cam is None:
+            raise ValueError(f"No camera delivered a frame, tried {device_paths if self.cam_id == -1 else device_ptr}")
+        self.cam = cam
         self.device_ptr = device_ptr
         
+    def open_device(self, device_ptr, nmb_tries=5):
+        """
+        Opens device_ptr and returns the capture once it delivers a frame, or None after nmb_tries attempts.
+        """
+        for _ in range(nmb_tries):
+            cam = cv2.VideoCapture(device_ptr)
+            # probing, the capture that is kept reports unsupported properties in smart_init
+            self.set_cap_props(cam, verbose=False)
+            _, img = cam.read()
+            if img is not None:
+                return cam
+            cam.release()
+            time.sleep(0.05)
+        return None
+        
     def init_mac(self):
         self.cam = cv2.VideoCapture(self.cam_id, cv2.CAP_AVFOUNDATION)
         
     def release(self):
+        """
+        Stops the capture thread and releases the camera. If you showed images with
+        cv2.imshow, calling cv2.destroyAllWindows is up to you.
+        """
         self.threader_active = False
-        self.thread.join()
-        self.cam.release()
-        cv2.destroyAllWindows()
-        cv2.VideoCapture(self.cam_id).release()    
+        if hasattr(self, 'thread'):
+            self.thread.join(timeout=1.0)
+        # a thread still stuck in grab() releases the camera itself once it exits
+        if not hasattr(self, 'thread') or not self.thread.is_alive():
+            self.cam.release()
 
     def smart_init(self):
-        if get_os_type() == "Ubuntu":
+        if OS_TYPE == "Ubuntu":
             self.init_ubuntu()
-        elif get_os_type() == "MacOS":
+        elif OS_TYPE == "MacOS":
             self.init_mac()
         else:
             raise NotImplementedError("Only Ubuntu and Mac supported.")
         self.set_cap_props()
         
-    def set_cap_props(self):
+    def set_cap_props(self, cam=None, verbose=True):
+        cam = self.cam if cam is None else cam
         codec = 0x47504A4D  # MJPG
-        self.cam.set(cv2.CAP_PROP_FPS, 30.0)
-        self.cam.set(cv2.CAP_PROP_FOURCC, codec)
-        self.cam.set(cv2.CAP_PROP_FRAME_WIDTH,self.shape_hw[1])
-        self.cam.set(cv2.CAP_PROP_FRAME_HEIGHT,self.shape_hw[0])
+        cam.set(cv2.CAP_PROP_FPS, 30.0)
+        cam.set(cv2.CAP_PROP_FOURCC, codec)
+        cam.set(cv2.CAP_PROP_FRAME_WIDTH,self.shape_hw[1])
+        cam.set(cv2.CAP_PROP_FRAME_HEIGHT,self.shape_hw[0])
+        # keep only the newest frame in the driver queue to avoid multi-frame latency
+        if not cam.set(cv2.CAP_PROP_BUFFERSIZE, 1) and verbose:
+            print("set_cap_props: CAP_PROP_BUFFERSIZE not supported by backend")
 
     def set_focus_inf(self):
         self.cam.set(cv2.CAP_PROP_AUTOFOCUS, 0)
@@ -105,33 +156,83 @@ class WebCam():
 
     def threader_runfunc_cam(self):
         while self.threader_active:
-            img = self.get_raw_image()
+            time_start = time.time()
+            # decode every grabbed frame, so get_img always hands out the newest one
+            grabbed = self.cam.grab()
+            img = self.get_raw_image() if grabbed else None
             if img is None:
+                if not self.threader_active:
+                    # release() was called while we were waiting for the camera
+                    break
                 print("threader_runfunc_cam: bad img is None. trying to repair...")
                 self.cam.release()
                 cv2.VideoCapture(self.device_ptr).release()
-                self.smart_init()
+                try:
+                    self.smart_init()
+                except ValueError as e:
+                    print(f"threader_runfunc_cam: repair failed ({e}), retrying...")
                 time.sleep(1)
             else:
-                self.img_last = self.process_raw_image(img)
-            time.sleep(self.sleep_time_thread)
+                self.process_raw_image(img)
+                self.hand_over_back_buffer()
+            self.limit_fps(time_start)
+        self.cam.release()
+
+    def limit_fps(self, time_start):
+        if self.target_fps:
+            time.sleep(max(0, 1 / self.target_fps - (time.time() - time_start)))
 
     def get_raw_image(self):
-        _, img = self.cam.read()
+        _, img = self.cam.retrieve()
         if img is None or img.size < 100:
             print("get_raw_image: fail, image is bad.")
             return
         return img
 
     def process_raw_image(self, img):
-        if self.shift_colors:
-            img = np.flip(img, axis=2)
+        """
+        Writes the processed image into the back buffer and returns it.
+        """
+        back = self._bufs[self._back]
+        shape = (img.shape[0], img.shape[1], self.nmb_channels)
+        if back.shape != shape:
+            # camera did not honor the requested resolution
+            back = np.empty(shape, dtype=np.uint8)
+            self._bufs[self._back] = back
+        if self.nmb_channels == 4:
+            # alpha is filled with 255 by OpenCV
+            code = cv2.COLOR_BGR2RGBA if self.shift_colors else cv2.COLOR_BGR2BGRA
+            cv2.cvtColor(img, code, dst=back)
+        elif self.shift_colors:
+            cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=back)
+        else:
+            np.copyto(back, img)
         if self.do_mirror:
-            img = np.flip(img, 1)
-        return img
+            cv2.flip(back, 1, dst=back)
+        return back
+    
+    def hand_over_back_buffer(self):
+        # called from the capture thread only
+        try:
+            # the previous frame was not picked up, its buffer can be written again
+            next_back = self._slot.get_nowait()
+        except queue.Empty:
+            # get_img took the previous frame and released the buffer it held before
+            next_back = 3 - self._last_handed - self._back
+        self._slot.put_nowait(self._back)
+        self._last_handed = self._back
+        self._back = next_back
     
     def get_img(self):
-        return self.img_last
+        """
+        Returns the latest frame. The returned array is not written to until the
+        next call of get_img, copy it if you need to keep it longer.
+        """
+        try:
+            self._front = self._slot.get_nowait()
+        except queue.Empty:
+            pass
+        return self._bufs[self._front]
 
         
 if __name__ == "__main__":
@@ -10,8 +10,12 @@ from PIL import Image
 import cv2
 from lunar_tools.utils import get_os_type
 
-if get_os_type() == "Ubuntu":
+OS_TYPE = get_os_type()
+
+if OS_TYPE == "Ubuntu":
     from cuda import cudart as cu
+    from cuda import cuda as cuda_driver
+    from cuda import nvrtc
     
     with warnings.catch_warnings():
         warnings.filterwarnings(action="ignore", category=UserWarning)
@@ -92,6 +96,97 @@ def create_shader_program():
     fragment_shader = compileShader(FRAGMENT_SHADER_SOURCE, GL_FRAGMENT_SHADER)
     return compileProgram(vertex_shader, fragment_shader)
 
+def to_rgba_f32(image, out=None):
+    # HxWxC image in [0, 255] -> HxWx4 float32 in [0, 1]
+    # if out is given, the result is written into it and its alpha plane is kept for RGB inputs
+    if out is None:
+        out = torch.ones((image.shape[0], image.shape[1], 4), dtype=torch.float32, device=image.device)
+    channels = out[:, :, :image.shape[2]]
+    channels.copy_(image)
+    channels.div_(255)
+    if image.dtype != torch.uint8:  # uint8 is already in range
+        channels.clamp_(0, 1)
+    return out
+
+# single pass uint8 RGB(A) -> float32 RGBA conversion, one thread per pixel,
+# writing straight into the texture through a surface object
+RGBA_KERNEL_SOURCE = """
+extern "C" __global__ void u8_to_rgba_f32(const unsigned char* __restrict__ src, cudaSurfaceObject_t dst,
+                                          int width, int height, int nmb_channels)
+{
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= width || y >= height)
+        return;
+    const unsigned char* px = src + (y * width + x) * nmb_channels;
+    float alpha = nmb_channels == 4 ? px[3] / 255.0f : 1.0f;
+    surf2Dwrite(make_float4(px[0] / 255.0f, px[1] / 255.0f, px[2] / 255.0f, alpha), dst, x * sizeof(float4), y);
+}
+"""
+
+class RGBAKernel():
+    def __init__(self, gpu_id: int = 0, block_size: int = 16):
+        """
+        Compiles RGBA_KERNEL_SOURCE with NVRTC for the architecture of the given GPU.
+        """
+        self.block_size = block_size
+        self.gpu_id = gpu_id
+        major, minor = torch.cuda.get_device_capability(gpu_id)
+        err, prog = nvrtc.nvrtcCreateProgram(RGBA_KERNEL_SOURCE.encode(), b"u8_to_rgba_f32.cu", 0, [], [])
+        if err != nvrtc.nvrtcResult.NVRTC_SUCCESS:
+            raise CudaException("Unable to create NVRTC program")
+        try:
+            opts = [f"--gpu-architecture=compute_{major}{minor}".encode()]
+            (err,) = nvrtc.nvrtcCompileProgram(prog, len(opts), opts)
+            if err != nvrtc.nvrtcResult.NVRTC_SUCCESS:
+                _, log_size = nvrtc.nvrtcGetProgramLogSize(prog)
+                log = b" " * log_size
+                nvrtc.nvrtcGetProgramLog(prog, log)
+                raise CudaException(f"Unable to compile rgba kernel: {log.decode(errors='replace').strip()}")
+            err, ptx_size = nvrtc.nvrtcGetPTXSize(prog)
+            if err != nvrtc.nvrtcResult.NVRTC_SUCCESS:
+                raise CudaException("Unable to get PTX size of rgba kernel")
+            ptx = b" " * ptx_size
+            (err,) = nvrtc.nvrtcGetPTX(prog, ptx)
+            if err != nvrtc.nvrtcResult.NVRTC_SUCCESS:
+                raise CudaException("Unable to get PTX of rgba kernel")
+        finally:
+            nvrtc.nvrtcDestroyProgram(prog)
+        
+        # the driver API loads the module into the context that is current on this thread.
+        # selecting the device through torch makes the primary context of gpu_id current
+        with torch.cuda.device(gpu_id):
+            err, self.module = cuda_driver.cuModuleLoadData(np.char.array(ptx))
+            if err != cuda_driver.CUresult.CUDA_SUCCESS:
+                raise CudaException("Unable to load rgba kernel module")
+            err, self.kernel = cuda_driver.cuModuleGetFunction(self.module, b"u8_to_rgba_f32")
+            if err != cuda_driver.CUresult.CUDA_SUCCESS:
+                raise CudaException("Unable to get rgba kernel function")
+
+    def __call__(self, src, surface, stream):
+        # src: contiguous HxWxC uint8 cuda tensor, surface: surface object of a HxW float32 RGBA array
+        height, width, nmb_channels = src.shape
+        kernel_args = (
+            (src.data_ptr(), int(surface), width, height, nmb_channels),
+            (ctypes.c_void_p, ctypes.c_ulonglong, ctypes.c_int, ctypes.c_int, ctypes.c_int),
+        )
+        with torch.cuda.device(self.gpu_id):
+            (err,) = cuda_driver.cuLaunchKernel(
+                self.kernel,
+                (width + self.block_size - 1) // self.block_size,
+                (height + self.block_size - 1) // self.block_size,
+                1,
+                self.block_size,
+                self.block_size,
+                1,
+                0,
+                cuda_driver.CUstream(stream.cuda_stream),
+                kernel_args,
+                0,
+            )
+        if err != cuda_driver.CUresult.CUDA_SUCCESS:
+            raise CudaException("Unable to launch rgba kernel")
+
 class PeripheralEvent():
     def __init__(self):
         self.keycode = -1
@@ -99,26 +194,20 @@ class PeripheralEvent():
         self.mouse_posX = -1
         self.mouse_posY = -1
 
-# keycode conversion function  SDL2 -> OpenCV convention
-def sdl_to_cv2_keycode(sdl_keycode):
-    # Map for common keys (alphabets and numbers)
-    if sdl2.SDL_SCANCODE_A <= sdl_keycode <= sdl2.SDL_SCANCODE_Z:
-        return ord(chr(sdl_keycode - sdl2.SDL_SCANCODE_A + ord('a')))
-    elif sdl2.SDL_SCANCODE_1 <= sdl_keycode <= sdl2.SDL_SCANCODE_0:
-        return ord(chr(sdl_keycode - sdl2.SDL_SCANCODE_1 + ord('1')))
+# keycode conversion SDL2 -> OpenCV convention, as a lookup table indexed by SDL scancode
+def build_sdl_to_cv2_keycode_table():
+    table = np.full(sdl2.SDL_NUM_SCANCODES, -1, dtype=np.int32)
+    
+    # alphabet
+    for i in range(26):
+        table[sdl2.SDL_SCANCODE_A + i] = ord('a') + i
     
-    # Digits
-        if sdl2.SDL_SCANCODE_1 <= sdl_keycode <= sdl2.SDL_SCANCODE_0:
-            return ord(chr(sdl_keycode - sdl2.SDL_SCANCODE_1 + ord('1')))    
+    # digits, SDL orders them 1..9, 0
+    for i in range(9):
+        table[sdl2.SDL_SCANCODE_1 + i] = ord('1') + i
+    table[sdl2.SDL_SCANCODE_0] = ord('0')
     
     special_keys_map = {
-        sdl2.SDL_SCANCODE_RETURN: 13,     # Enter key
-        sdl2.SDL_SCANCODE_ESCAPE: 27,     # Escape key
-        sdl2.SDL_SCANCODE_BACKSPACE: 8,   # Backspace key
-        sdl2.SDL_SCANCODE_TAB: 9,         # Tab key
-        sdl2.SDL_SCANCODE_SPACE: 32,      # Space key
-        sdl2.SDL_SCANCODE_F1: 0x700000,   # F1 key
-        sdl2.SDL_SCANCODE_F2: 0x710000,   # F2 key
         sdl2.SDL_SCANCODE_RETURN: 13,     # Enter key
         sdl2.SDL_SCANCODE_ESCAPE: 27,     # Escape key
         sdl2.SDL_SCANCODE_BACKSPACE: 8,   # Backspace key
@@ -136,32 +225,41 @@ def sdl_to_cv2_keycode(sdl_keycode):
         # Add other special keys here
         # ...
     }
-    
-    if sdl_keycode in special_keys_map:
-        return special_keys_map.get(sdl_keycode, -1)
-    elif sdl_keycode == -1:
-        pass
-    else:
-        print('sdl_to_cv2_keycode -> unknown key code')
-        return -1
+    for sdl_keycode, cv2_keycode in special_keys_map.items():
+        table[sdl_keycode] = cv2_keycode
+    return table
+
+if OS_TYPE == "Ubuntu":
+    SDL_TO_CV2_KEYCODE_TABLE = build_sdl_to_cv2_keycode_table()
+
+def sdl_to_cv2_keycode(sdl_keycode):
+    if 0 <= sdl_keycode < SDL_TO_CV2_KEYCODE_TABLE.size:
+        return int(SDL_TO_CV2_KEYCODE_TABLE[sdl_keycode])
+    return -1
 
 class Renderer:
     def __init__(self, width: int = 1920, height: int = 1080, 
                  gpu_id: int = 0,
-                 window_title: str = "lunar_render_window"):
+                 window_title: str = "lunar_render_window",
+                 event_batch_size: int = 32):
         
         self.window_title = window_title
         self.gpu_id = gpu_id
         self.width = width
         self.height = height
+        self._rgba_buffer = None
+        self._rgba_buffer_alpha_is_one = False
+        self.event_batch_size = event_batch_size
         
-        if get_os_type() == "Ubuntu":
+        if OS_TYPE == "Ubuntu":
             self.backend = 'gl'
             self.cuda_is_setup = False
             self.running = True
             self.sdl_setup()
             self.gl_setup()
             self.cuda_setup()
+            self.upload_setup()
+            self.kernel_setup()
         else:
             self.backend = 'opencv'
         
@@ -188,10 +286,28 @@ class Renderer:
             video.SDL_GL_CONTEXT_PROFILE_MASK, video.SDL_GL_CONTEXT_PROFILE_CORE
         )
         self.gl_context = sdl2.SDL_GL_CreateContext(self.sdl_window)
+        
+        # zero-copy view on SDL's keyboard state, which stays valid for the lifetime of the application
+        nmb_keys = ctypes.c_int(0)
+        key_states_ptr = sdl2.SDL_GetKeyboardState(ctypes.byref(nmb_keys))
+        self._key_states = np.ctypeslib.as_array(key_states_ptr, shape=(nmb_keys.value,))
+        self._key_states_prev = np.zeros(nmb_keys.value, dtype=np.uint8)
+        
+        self._event_buffer = (sdl2.SDL_Event * self.event_batch_size)()
+        self._mouse_posX, self._mouse_posY = ctypes.c_int(0), ctypes.c_int(0)
 
     def gl_setup(self):
+        # program objects belong to this renderer's GL context, so they are compiled once per Renderer
         self.shader_program = create_shader_program()
+        self.tex_sampler_loc = gl.glGetUniformLocation(self.shader_program, b'texSampler')
+        gl.glUseProgram(self.shader_program)
+        gl.glUniform1i(self.tex_sampler_loc, 0)
+        gl.glUseProgram(0)
+        
+        # the triangle is generated in the vertex shader, so the empty VAO stays bound for good
         self.vao = gl.glGenVertexArrays(1)
+        gl.glBindVertexArray(self.vao)
+        gl.glClearColor(0, 0, 0, 1)
 
         self.tex = gl.glGenTextures(1)
         gl.glBindTexture(gl.GL_TEXTURE_2D, self.tex)
@@ -230,62 +346,114 @@ class Renderer:
         err, self.cuda_image = cu.cudaGraphicsGLRegisterImage(
             self.tex,
             gl.GL_TEXTURE_2D,
-            cu.cudaGraphicsRegisterFlags.cudaGraphicsRegisterFlagsWriteDiscard,
+            cu.cudaGraphicsRegisterFlags.cudaGraphicsRegisterFlagsWriteDiscard
+            | cu.cudaGraphicsRegisterFlags.cudaGraphicsRegisterFlagsSurfaceLoadStore,
         )
         if err != cu.cudaError_t.cudaSuccess:
             raise CudaException("Unable to register opengl texture")
 
         self.cuda_is_setup = True
 
+    def kernel_setup(self):
+        # fused uint8 -> RGBA float32 kernel, falls back to the torch op chain if NVRTC is unavailable
+        try:
+            self.rgba_kernel = RGBAKernel(self.gpu_id)
+        except Exception as e:
+            logger.warning(f"kernel_setup: rgba kernel not available, using torch conversion ({e})")
+            self.rgba_kernel = None
+
+    def upload_setup(self):
+        # two slots of pinned host staging buffer + device buffer for CPU inputs, so the upload of the
+        # next frame can overlap with the rendering of the current one. (re)allocated on shape/dtype change
+        self._upload_stream = torch.cuda.Stream(device=self.gpu_id)
+        self._upload_slot = 0
+        self._pinned_buffers = [None, None]
+        self._upload_buffers = [None, None]
+        self._upload_done = [torch.cuda.Event(), torch.cuda.Event()]
+        self._upload_consumed = [torch.cuda.Event(), torch.cuda.Event()]
+
+    def upload_to_gpu(self, image):
+        # copy a CPU image into pinned memory and upload it asynchronously on the upload stream
+        if isinstance(image, torch.Tensor):
+            # keep the tensor's dtype, numpy can't represent all of them (e.g. bfloat16)
+            shape, dtype = image.shape, image.dtype
+        else:
+            image = np.asarray(image)
+            shape, dtype = image.shape, torch.from_numpy(np.empty(0, dtype=image.dtype)).dtype
+        slot = self._upload_slot
+        self._upload_slot = 1 - slot
+        render_stream = torch.cuda.current_stream(self.gpu_id)
+        
+        # the reads of the frame uploaded into the other slot are all queued on the render stream by now
+        self._upload_consumed[1 - slot].record(render_stream)
+        
+        pinned_buffer = self._pinned_buffers[slot]
+        if pinned_buffer is None or pinned_buffer.shape != shape or pinned_buffer.dtype != dtype:
+            # rare, so simply make sure nothing uses the old buffers anymore
+            torch.cuda.synchronize(self.gpu_id)
+            pinned_buffer = torch.empty(shape, dtype=dtype, pin_memory=True)
+            self._pinned_buffers[slot] = pinned_buffer
+            self._upload_buffers[slot] = torch.empty(shape, dtype=dtype, device=f'cuda:{self.gpu_id}')
+        else:
+            # the upload from two frames ago must have finished reading this pinned buffer
+            self._upload_done[slot].synchronize()
+        if isinstance(image, torch.Tensor):
+            pinned_buffer.copy_(image.detach())
+        else:
+            # read-only (PIL) and negative-stride arrays are fine here, unlike with torch.from_numpy
+            pinned_buffer.numpy()[...] = image
+        
+        with torch.cuda.stream(self._upload_stream):
+            # the frame from two frames ago must have finished reading this device buffer
+            self._upload_stream.wait_event(self._upload_consumed[slot])
+            self._upload_buffers[slot].copy_(pinned_buffer, non_blocking=True)
+            self._upload_done[slot].record(self._upload_stream)
+        render_stream.wait_event(self._upload_done[slot])
+        return self._upload_buffers[slot]
+
     def gl_draw_internal(self):
         gl.glUseProgram(self.shader_program)
         try:
-            gl.glClearColor(0, 0, 0, 1)
             gl.glClear(gl.GL_COLOR_BUFFER_BIT)
             gl.glBindTexture(gl.GL_TEXTURE_2D, self.tex)
-            gl.glBindVertexArray(self.vao)
             gl.glDrawArrays(gl.GL_TRIANGLES, 0, 3)
         finally:
             gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
-            gl.glBindVertexArray(0)
             gl.glUseProgram(0)
         sdl2.SDL_GL_SwapWindow(self.sdl_window)
 
     def gl_step(self):
-        event = sdl2.SDL_Event()
-        
-        # retrieve presses keyboard key codes
-        key_states = sdl2.SDL_GetKeyboardState(None)
-        
-        # handle mouse presses
-        mouse_posX, mouse_posY = ctypes.c_int(0), ctypes.c_int(0)
-
         pressed_key_code = -1
         mouse_buttonstate = -1
         if self.running:
-            key_press_tracker_array = np.zeros((sdl2.SDL_NUM_SCANCODES,), dtype=np.int8)
-            while sdl2.SDL_PollEvent(ctypes.byref(event)):
-                mouse_buttonstate = sdl2.mouse.SDL_GetMouseState(ctypes.byref(mouse_posX), ctypes.byref(mouse_posX))
-                
-                if (event.type == sdl2.SDL_WINDOWEVENT and event.window.event == sdl2.SDL_WINDOWEVENT_CLOSE):
-                    self.running = False
-                    self.gl_close()
+            # SDL events have to be pumped on the thread owning the window. drain the whole queue in batches
+            # into the preallocated event buffer, so slow frame rates can't let it grow
+            sdl2.SDL_PumpEvents()
+            got_events = False
+            nmb_events = len(self._event_buffer)
+            while self.running and nmb_events == len(self._event_buffer):
+                nmb_events = sdl2.SDL_PeepEvents(self._event_buffer, len(self._event_buffer), sdl2.SDL_GETEVENT, sdl2.SDL_FIRSTEVENT, sdl2.SDL_LASTEVENT)
+                got_events = got_events or nmb_events > 0
+                for event in self._event_buffer[:max(nmb_events, 0)]:
+                    if (event.type == sdl2.SDL_WINDOWEVENT and event.window.event == sdl2.SDL_WINDOWEVENT_CLOSE):
+                        self.running = False
+                        self.gl_close()
+                        break
+            if got_events and self.running:
+                # handle mouse presses
+                mouse_buttonstate = sdl2.mouse.SDL_GetMouseState(ctypes.byref(self._mouse_posX), ctypes.byref(self._mouse_posY))
     
-                # Exit code
-                if key_states[sdl2.SDL_SCANCODE_ESCAPE]:
-                    self.running = False
-                    self.gl_close()
-                    sys.exit(0)
-                
-                for key_code in range(sdl2.SDL_NUM_SCANCODES):
-                    # key pressed
-                    if key_states[key_code] and key_press_tracker_array[key_code] == 0:
-                        key_press_tracker_array[key_code] == 1
-                        pressed_key_code = key_code
-                        
-                    # key released
-                    elif not key_states[key_code] and key_press_tracker_array[key_code] == 1:
-                        key_press_tracker_array[key_code] == 0
+            # Exit code
+            if self._key_states[sdl2.SDL_SCANCODE_ESCAPE]:
+                self.running = False
+                self.gl_close()
+                sys.exit(0)
+            
+            # keys that went down since the last step
+            newly_pressed = np.flatnonzero(self._key_states & ~self._key_states_prev)
+            self._key_states_prev[:] = self._key_states
+            if newly_pressed.size > 0:
+                pressed_key_code = int(newly_pressed[-1])
                     
             self.gl_draw_internal()
             
@@ -295,76 +463,98 @@ class Renderer:
         peripheralEvent = PeripheralEvent()
         peripheralEvent.pressed_key_code = pressed_key_code
         peripheralEvent.mouse_button_state = mouse_buttonstate
-        peripheralEvent.mouse_posX = mouse_posX
-        peripheralEvent.mouse_posY = mouse_posY
+        peripheralEvent.mouse_posX = self._mouse_posX.value
+        peripheralEvent.mouse_posY = self._mouse_posY.value
         
         return peripheralEvent
 
+    def get_rgba_buffer(self, image):
+        # reuse the RGBA output buffer across frames, the alpha plane is only refilled when needed
+        shape = (image.shape[0], image.shape[1], 4)
+        if self._rgba_buffer is None or self._rgba_buffer.shape != shape or self._rgba_buffer.device != image.device:
+            self._rgba_buffer = torch.ones(shape, dtype=torch.float32, device=image.device)
+        elif image.shape[2] == 3 and not self._rgba_buffer_alpha_is_one:
+            self._rgba_buffer[:, :, 3].fill_(1)
+        self._rgba_buffer_alpha_is_one = image.shape[2] == 3
+        return self._rgba_buffer
+
+    def create_surface(self, array):
+        # surface object for the mapped texture array, only valid while the resource stays mapped
+        res_desc = cu.cudaResourceDesc()
+        res_desc.resType = cu.cudaResourceType.cudaResourceTypeArray
+        res_desc.res.array.array = array
+        err, surface = cu.cudaCreateSurfaceObject(res_desc)
+        if err != cu.cudaError_t.cudaSuccess:
+            raise CudaException("Unable to create surface object")
+        return surface
+
     def gl_render(self, image):
         
         # first check if input data types are valid
         if type(image) == torch.Tensor:
             if image.device.type == 'cpu':
                 # force placement on GPU
-                image = image.to(f'cuda:{self.gpu_id}')
+                image = self.upload_to_gpu(image)
         else:
             # cast as torch tensor / place on GPU
-            if type(image) == np.ndarray:
-                image = torch.from_numpy(image).to(f'cuda:{self.gpu_id}')
-            elif type(image) == Image.Image:
-                image = torch.from_numpy(np.array(image)).to(f'cuda:{self.gpu_id}')
+            if type(image) == np.ndarray or type(image) == Image.Image:
+                image = self.upload_to_gpu(image)
             else:
                 raise Exception('render function received input of unknown type')
                 
-        # bring to OpenGL-standard range
-        image = image.float() / 255
-                
-        # clamp to the valid range
-        image = torch.clamp(image, 0, 1)
-        
-        # transpose X/Y for openGL consistency
-        image = image.permute((1,0,2))
-                
         # check for number of channels
-        if len(image.shape) == 3:
-            if image.shape[2] == 3: # add rgbA channel
-                ones = torch.ones(image.size(0), image.size(1), 1, device=image.device)
-                image = torch.cat((image, ones), -1)
-            elif image.shape[2] == 4: # correct number of channels -> pass
-                pass
-            else:
-                raise Exception('render function received the wrong number of channels')
-        elif len(image.shape) == 2:  # grayscale input  -> to RGBA
-            image = torch.cat((image, )*4, -1)
-        else:
+        if len(image.shape) == 2:  # grayscale input -> to RGB
+            image = image.unsqueeze(-1).expand(-1, -1, 3)
+        if len(image.shape) != 3 or image.shape[2] not in (3, 4):
             raise Exception('render function received the wrong number of channels')
             
+        # the texture is filled row by row from the contiguous HxWx4 buffer, so no X/Y transpose is needed
+        if image.shape[0] != self.height or image.shape[1] != self.width:
+            raise Exception(f'render function received shape {tuple(image.shape[:2])}, expected {(self.height, self.width)}')
+            
+        # bring to OpenGL-standard range and RGBA, uint8 input is converted by the kernel while writing the texture
+        use_kernel = self.rgba_kernel is not None and image.dtype == torch.uint8
+        if use_kernel:
+            image = image.contiguous()
+        else:
+            image = to_rgba_f32(image, self.get_rgba_buffer(image))
+            
         # do rendering
         if not self.running:
             return
         if not self.cuda_is_setup:
             self.cuda_setup()
-        (err,) = cu.cudaGraphicsMapResources(1, self.cuda_image, cu.cudaStreamLegacy)
+        # map, write and unmap on the stream torch uses, so the unmap is ordered after the write
+        stream = torch.cuda.current_stream(self.gpu_id)
+        cuda_stream = cu.cudaStream_t(stream.cuda_stream)
+        (err,) = cu.cudaGraphicsMapResources(1, self.cuda_image, cuda_stream)
         if err != cu.cudaError_t.cudaSuccess:
             raise CudaException("Unable to map graphics resource")
         err, array = cu.cudaGraphicsSubResourceGetMappedArray(self.cuda_image, 0, 0)
         if err != cu.cudaError_t.cudaSuccess:
             raise CudaException("Unable to get mapped array")
-        (err,) = cu.cudaMemcpy2DToArrayAsync(
-            array,
-            0,
-            0,
-            image.data_ptr(),
-            4 * 4 * self.width,
-            4 * 4 * self.width,
-            self.height,
-            cu.cudaMemcpyKind.cudaMemcpyDeviceToDevice,
-            cu.cudaStreamLegacy,
-        )
-        if err != cu.cudaError_t.cudaSuccess:
-            raise CudaException("Unable to copy from tensor to texture")
+        if use_kernel:
+            surface = self.create_surface(array)
+            try:
+                self.rgba_kernel(image, surface, stream)
+            finally:
+                cu.cudaDestroySurfaceObject(surface)
+        else:
+            (err,) = cu.cudaMemcpy2DToArrayAsync(
+                array,
+                0,
+                0,
+                image.data_ptr(),
+                4 * 4 * self.width,
+                4 * 4 * self.width,
+                self.height,
+                cu.cudaMemcpyKind.cudaMemcpyDeviceToDevice,
+                cuda_stream,
+            )
+            if err != cu.cudaError_t.cudaSuccess:
+                raise CudaException("Unable to copy from tensor to texture")
 
-        (err,) = cu.cudaGraphicsUnmapResources(1, self.cuda_image, cu.cudaStreamLegacy)
+        (err,) = cu.cudaGraphicsUnmapResources(1, self.cuda_image, cuda_stream)
         if err != cu.cudaError_t.cudaSuccess:
             raise CudaException("Unable to unmap graphics resource")
         pressed_key_code = self.gl_step()
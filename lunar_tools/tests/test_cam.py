@@ -0,0 +1,44 @@
+import os
+import sys
+import queue
+import random
+import numpy as np
+sys.path.append(os.path.abspath('.'))
+from lunar_tools.cam import WebCam
+
+
+def make_webcam():
+    # only the frame hand-over state, no camera or capture thread
+    cam = object.__new__(WebCam)
+    cam._bufs = [np.full((2, 2, 3), k, dtype=np.uint8) for k in range(3)]
+    cam._slot = queue.Queue(maxsize=1)
+    cam._front = 0
+    cam._back = 1
+    cam._last_handed = 0
+    return cam
+
+def test_buffer_rotation_keeps_buffers_distinct():
+    random.seed(0)
+    cam = make_webcam()
+    for _ in range(10000):
+        if random.random() < 0.5:
+            cam.hand_over_back_buffer()
+        else:
+            img = cam.get_img()
+            assert img is cam._bufs[cam._front]
+        assert cam._back != cam._front
+        in_slot = list(cam._slot.queue)
+        if in_slot:
+            assert sorted([cam._front, cam._back, in_slot[0]]) == [0, 1, 2]
+        else:
+            # get_img took the last handed buffer, it is the front one now
+            assert cam._front == cam._last_handed
+
+def test_get_img_returns_newest_frame():
+    cam = make_webcam()
+    cam.hand_over_back_buffer()
+    cam.hand_over_back_buffer()  # replaces the frame nobody picked up
+    newest = cam._last_handed
+    assert cam.get_img() is cam._bufs[newest]
+    # no new frame, the same buffer is returned again
+    assert cam.get_img() is cam._bufs[newest]
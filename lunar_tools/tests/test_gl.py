@@ -0,0 +1,23 @@
+import os
+import sys
+sys.path.append(os.path.abspath('.'))
+import sdl2
+from lunar_tools.gl import build_sdl_to_cv2_keycode_table, sdl_to_cv2_keycode
+
+
+def test_keycode_table():
+    table = build_sdl_to_cv2_keycode_table()
+    assert table.size == sdl2.SDL_NUM_SCANCODES
+    assert table[sdl2.SDL_SCANCODE_A] == ord('a')
+    assert table[sdl2.SDL_SCANCODE_Z] == ord('z')
+    assert table[sdl2.SDL_SCANCODE_1] == ord('1')
+    assert table[sdl2.SDL_SCANCODE_9] == ord('9')
+    assert table[sdl2.SDL_SCANCODE_0] == ord('0')
+    assert table[sdl2.SDL_SCANCODE_RETURN] == 13
+    assert table[sdl2.SDL_SCANCODE_UP] == 0x260000
+    assert table[sdl2.SDL_SCANCODE_CAPSLOCK] == -1
+
+def test_keycode_conversion_out_of_range():
+    assert sdl_to_cv2_keycode(sdl2.SDL_SCANCODE_A) == ord('a')
+    assert sdl_to_cv2_keycode(-1) == -1
+    assert sdl_to_cv2_keycode(sdl2.SDL_NUM_SCANCODES) == -1